@@ -0,0 +1,68 @@
+#!/bin/bash
+
+# Нагрузочный тест delivery-service при 10/50/200 одновременных соединениях.
+# Для сравнения "до/после" запустите скрипт на каждой версии сервиса с разной меткой:
+#   ./benchmark_delivery.sh before
+#   ./benchmark_delivery.sh after
+# Результаты дописываются в один файл.
+
+LABEL=${1:-current}
+DURATION=10s
+THREADS=4
+USERS_HOST="http://localhost:8082"
+HOST="http://localhost:8081"
+
+USERNAME="admin"
+PASSWORD="secret"
+
+RESULTS_FILE="delivery_performance_results.txt"
+
+echo "Getting authentication token..."
+TOKEN_RESPONSE=$(curl -s -X POST "$USERS_HOST/token" \
+    -H "Content-Type: application/x-www-form-urlencoded" \
+    -d "username=$USERNAME&password=$PASSWORD")
+
+if command -v jq &> /dev/null; then
+    ACCESS_TOKEN=$(echo $TOKEN_RESPONSE | jq -r '.access_token')
+else
+    ACCESS_TOKEN=$(echo $TOKEN_RESPONSE | grep -o '"access_token":"[^"]*' | cut -d'"' -f4)
+fi
+
+if [ -z "$ACCESS_TOKEN" ] || [ "$ACCESS_TOKEN" == "null" ]; then
+    echo "Failed to get access token. Check your username and password."
+    echo "Response: $TOKEN_RESPONSE"
+    exit 1
+fi
+
+echo "Successfully obtained access token."
+AUTH_HEADER="Authorization: Bearer $ACCESS_TOKEN"
+
+if [ ! -f $RESULTS_FILE ]; then
+    echo "Delivery Performance Test Results" > $RESULTS_FILE
+    echo "=================================" >> $RESULTS_FILE
+    echo "" >> $RESULTS_FILE
+fi
+
+echo "## $LABEL ($(date))" >> $RESULTS_FILE
+echo "" >> $RESULTS_FILE
+
+run_test() {
+    local endpoint=$1
+    local description=$2
+    local connections=$3
+
+    echo "Testing: $description (Threads: $THREADS, Connections: $connections)" >> $RESULTS_FILE
+    echo "Endpoint: $endpoint" >> $RESULTS_FILE
+    echo "--------------------------------------" >> $RESULTS_FILE
+
+    wrk -t$THREADS -c$connections -d$DURATION --latency -H "$AUTH_HEADER" $endpoint >> $RESULTS_FILE
+
+    echo "" >> $RESULTS_FILE
+    echo "" >> $RESULTS_FILE
+}
+
+for connections in 10 50 200; do
+    run_test "$HOST/deliveries/list?limit=50" "List deliveries" $connections
+done
+
+echo "Tests completed. Results saved to $RESULTS_FILE"
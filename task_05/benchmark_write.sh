@@ -0,0 +1,96 @@
+#!/bin/bash
+
+# Нагрузочный тест операций записи: POST /deliveries/create и POST /users/create.
+# Для сравнения "до/после" запустите скрипт на каждой версии сервиса с разной меткой:
+#   ./benchmark_write.sh before
+#   ./benchmark_write.sh after
+# Время /users/create в основном уходит на bcrypt, поэтому разница от
+# убранного чтения после записи заметнее на /deliveries/create.
+
+LABEL=${1:-current}
+DURATION=10s
+THREADS=4
+CONNECTIONS=10
+USERS_HOST="http://localhost:8082"
+DELIVERY_HOST="http://localhost:8081"
+
+USERNAME="admin"
+PASSWORD="secret"
+
+RESULTS_FILE="write_performance_results.txt"
+
+echo "Getting authentication token..."
+TOKEN_RESPONSE=$(curl -s -X POST "$USERS_HOST/token" \
+    -H "Content-Type: application/x-www-form-urlencoded" \
+    -d "username=$USERNAME&password=$PASSWORD")
+
+if command -v jq &> /dev/null; then
+    ACCESS_TOKEN=$(echo $TOKEN_RESPONSE | jq -r '.access_token')
+else
+    ACCESS_TOKEN=$(echo $TOKEN_RESPONSE | grep -o '"access_token":"[^"]*' | cut -d'"' -f4)
+fi
+
+if [ -z "$ACCESS_TOKEN" ] || [ "$ACCESS_TOKEN" == "null" ]; then
+    echo "Failed to get access token. Check your username and password."
+    echo "Response: $TOKEN_RESPONSE"
+    exit 1
+fi
+
+echo "Successfully obtained access token."
+AUTH_HEADER="Authorization: Bearer $ACCESS_TOKEN"
+
+LUA_DIR=$(mktemp -d)
+trap "rm -rf $LUA_DIR" EXIT
+
+cat > $LUA_DIR/create_delivery.lua <<'EOF'
+wrk.method = "POST"
+wrk.headers["Content-Type"] = "application/json"
+wrk.body = '{"description":"Benchmark delivery","address":"ul. Lenina, 1","contact_phone":"+7 (999) 000-00-00"}'
+EOF
+
+# У каждого пользователя должны быть уникальные username и email
+cat > $LUA_DIR/create_user.lua <<'EOF'
+-- Заголовки задаются в wrk.headers: явная таблица в wrk.format заменила бы их
+-- вместе с Authorization, переданным через -H
+wrk.headers["Content-Type"] = "application/json"
+counter = 0
+math.randomseed(os.time())
+request = function()
+    counter = counter + 1
+    local name = string.format("bench_%d_%d", math.random(1, 1000000000), counter)
+    local body = string.format(
+        '{"name":"Bench","surname":"User","email":"%s@bench.example.com","age":30,"username":"%s","password":"secret"}',
+        name, name
+    )
+    return wrk.format("POST", nil, nil, body)
+end
+EOF
+
+if [ ! -f $RESULTS_FILE ]; then
+    echo "Write Performance Test Results" > $RESULTS_FILE
+    echo "==============================" >> $RESULTS_FILE
+    echo "" >> $RESULTS_FILE
+fi
+
+echo "## $LABEL ($(date))" >> $RESULTS_FILE
+echo "" >> $RESULTS_FILE
+
+run_test() {
+    local endpoint=$1
+    local description=$2
+    local script=$3
+
+    echo "Testing: $description (Threads: $THREADS, Connections: $CONNECTIONS)" >> $RESULTS_FILE
+    echo "Endpoint: $endpoint" >> $RESULTS_FILE
+    echo "--------------------------------------" >> $RESULTS_FILE
+
+    wrk -t$THREADS -c$CONNECTIONS -d$DURATION --latency -H "$AUTH_HEADER" -s $script $endpoint >> $RESULTS_FILE
+
+    echo "" >> $RESULTS_FILE
+    echo "" >> $RESULTS_FILE
+}
+
+run_test "$DELIVERY_HOST/deliveries/create" "Create delivery" $LUA_DIR/create_delivery.lua
+run_test "$USERS_HOST/users/create" "Create user" $LUA_DIR/create_user.lua
+
+echo "Tests completed. Results saved to $RESULTS_FILE"
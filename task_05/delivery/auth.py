@@ -1,35 +1,137 @@
+from collections import OrderedDict
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import JWTError, jwt
 import aiohttp
+import asyncio
+import time
+import os
 
-USERS_SERVICE_URL = "http://users-service:8082"
+from users_client import get_session
+from token_cache import get_or_validate
+
+USERS_SERVICE_URL = os.environ.get("USERS_SERVICE_URL", "http://users-service:8082")
+
+# Режим проверки токена: local - проверка подписи на месте, remote - запрос в users-service
+AUTH_MODE = os.environ.get("AUTH_MODE", "local")
+
+# Общий с users-service секрет (HS256) либо URL публичного ключа (RS256/ES256)
+SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key")
+ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
+PUBLIC_KEY_URL = os.environ.get("JWT_PUBLIC_KEY_URL")
+PUBLIC_KEY_REFRESH_SECONDS = int(os.environ.get("JWT_PUBLIC_KEY_REFRESH_SECONDS", "300"))
+
+# Опциональная проверка, что пользователь из токена всё ещё существует
+REVOCATION_CHECK = os.environ.get("AUTH_REVOCATION_CHECK", "false").lower() == "true"
+REVOCATION_CHECK_INTERVAL = int(os.environ.get("AUTH_REVOCATION_CHECK_INTERVAL", "60"))
+REVOCATION_CACHE_SIZE = int(os.environ.get("AUTH_REVOCATION_CACHE_SIZE", "10000"))
+
+# Пользователи, которым доступен просмотр всех доставок
+ADMIN_USER_IDS = {
+    int(user_id) for user_id in os.environ.get("ADMIN_USER_IDS", "1").split(",") if user_id.strip()
+}
 
 security = HTTPBearer()
 
+_public_key = None
+_public_key_fetched_at = 0.0
 
-async def validate_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
+# user_id -> время последней успешной проверки в users-service
+_revocation_checked = OrderedDict()
+
+
+def credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def validate_token_remote(token: str) -> int:
+    """Проверка токена через users-service (/validate-token)"""
+    session = await get_session()
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{USERS_SERVICE_URL}/validate-token", 
-                headers={"Authorization": f"Bearer {token}"}
-            ) as response:
-                if response.status != 200:
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Invalid authentication credentials",
-                        headers={"WWW-Authenticate": "Bearer"},
-                    )
-
-                user_data = await response.json()
-                return int(user_data.get("user_id"))
-    except aiohttp.ClientError:
+        async with session.post(
+            f"{USERS_SERVICE_URL}/validate-token",
+            headers={"Authorization": f"Bearer {token}"}
+        ) as response:
+            if response.status != 200:
+                raise credentials_exception()
+
+            user_data = await response.json()
+            return int(user_data.get("user_id"))
+    except (aiohttp.ClientError, asyncio.TimeoutError):
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Authentication service unavailable",
         )
 
 
+async def get_verification_key():
+    """Ключ для проверки подписи: общий секрет или периодически обновляемый публичный ключ"""
+    global _public_key, _public_key_fetched_at
+
+    if not PUBLIC_KEY_URL:
+        return SECRET_KEY
+
+    if _public_key is None or time.monotonic() - _public_key_fetched_at > PUBLIC_KEY_REFRESH_SECONDS:
+        session = await get_session()
+        try:
+            async with session.get(PUBLIC_KEY_URL) as response:
+                response.raise_for_status()
+                _public_key = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Если ключ уже был получен - продолжаем работать со старым до следующей попытки
+            if _public_key is None:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication service unavailable",
+                )
+        _public_key_fetched_at = time.monotonic()
+
+    return _public_key
+
+
+def decode_token(token: str, key: str) -> int:
+    try:
+        payload = jwt.decode(token, key, algorithms=[ALGORITHM])
+        return int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise credentials_exception()
+
+
+async def check_revocation(user_id: int, token: str):
+    """Не чаще раза в REVOCATION_CHECK_INTERVAL секунд проверяет, что пользователь существует"""
+    now = time.monotonic()
+    checked_at = _revocation_checked.get(user_id)
+    if checked_at is not None and now - checked_at < REVOCATION_CHECK_INTERVAL:
+        _revocation_checked.move_to_end(user_id)
+        return
+
+    if await validate_token_remote(token) != user_id:
+        raise credentials_exception()
+
+    _revocation_checked[user_id] = now
+    _revocation_checked.move_to_end(user_id)
+    while len(_revocation_checked) > REVOCATION_CACHE_SIZE:
+        _revocation_checked.popitem(last=False)
+
+
+async def validate_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    if AUTH_MODE == "remote":
+        return await get_or_validate(token, validate_token_remote)
+
+    user_id = decode_token(token, await get_verification_key())
+    if REVOCATION_CHECK:
+        await check_revocation(user_id, token)
+    return user_id
+
+
 async def get_current_user(user_id: int = Depends(validate_token)):
     return user_id
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_USER_IDS
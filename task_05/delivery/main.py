@@ -4,15 +4,20 @@ import contextlib
 import json
 
 from delivery import router as delivery_router
+from users_client import init_session, close_session, get_pool_stats
+from metrics import router as metrics_router, metrics_middleware
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
     with open("openapi.json", "w") as f:
         json.dump(app.openapi(), f)
+    await init_session()
     yield
+    await close_session()
 
 
 app = FastAPI(lifespan=lifespan)
+app.middleware("http")(metrics_middleware)
 
 
 @app.get("/")
@@ -20,7 +25,13 @@ def read_root():
     return {"status": "ok", "service": "delivery-service"}
 
 
+@app.get("/stats/users-client")
+def users_client_stats():
+    return get_pool_stats()
+
+
 app.include_router(delivery_router)
+app.include_router(metrics_router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Request, Response
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from pymongo import monitoring
+import time
+
+from users_client import get_pool_stats
+
+REQUEST_COUNT = Counter(
+    "http_requests_total", "Number of HTTP requests", ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed", ["method"]
+)
+
+# Пул соединений к users-service (см. users_client.py)
+USERS_CLIENT_IN_FLIGHT = Gauge(
+    "delivery_users_client_requests_in_flight", "Requests to users-service in flight"
+)
+USERS_CLIENT_QUEUED = Gauge(
+    "delivery_users_client_queued", "Requests waiting for a free users-service connection"
+)
+USERS_CLIENT_SATURATION = Gauge(
+    "delivery_users_client_pool_saturation", "Share of the users-service pool in use"
+)
+USERS_CLIENT_IN_FLIGHT.set_function(lambda: get_pool_stats()["requests_in_flight"])
+USERS_CLIENT_QUEUED.set_function(lambda: get_pool_stats()["queued_now"])
+USERS_CLIENT_SATURATION.set_function(lambda: get_pool_stats()["saturation"])
+
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "delivery_mongo_pool_checked_out", "MongoDB connections currently in use"
+)
+MONGO_POOL_CHECKOUT_FAILED = Counter(
+    "delivery_mongo_pool_checkout_failed_total", "Failed MongoDB connection checkouts", ["reason"]
+)
+
+router = APIRouter(tags=["metrics"])
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Считает занятые соединения пула MongoDB"""
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKED_OUT.inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.dec()
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILED.labels(str(event.reason)).inc()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+async def metrics_middleware(request: Request, call_next):
+    if request.url.path == "/metrics":
+        return await call_next(request)
+
+    REQUESTS_IN_FLIGHT.labels(request.method).inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.labels(request.method).dec()
+        # Шаблон пути (/deliveries/details), а не URL с параметрами - чтобы не плодить метки
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        REQUEST_COUNT.labels(request.method, path, str(status_code)).inc()
+        REQUEST_LATENCY.labels(request.method, path).observe(time.perf_counter() - start)
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
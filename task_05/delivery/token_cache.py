@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from jose import JWTError, jwt
+import redis.asyncio
+import hashlib
+import asyncio
+import time
+import os
+
+# Кэш результатов /validate-token: token hash -> user_id
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_MAX_TTL = int(os.environ.get("TOKEN_CACHE_MAX_TTL", "60"))
+# Второй уровень кэша в Redis включается, если задан URL
+TOKEN_CACHE_REDIS_URL = os.environ.get("TOKEN_CACHE_REDIS_URL")
+
+redis_client = (
+    redis.asyncio.from_url(TOKEN_CACHE_REDIS_URL, encoding="utf-8", decode_responses=True)
+    if TOKEN_CACHE_REDIS_URL else None
+)
+
+# token hash -> (user_id, время истечения)
+_local_cache = OrderedDict()
+# token hash -> задача, которая сейчас проверяет токен в users-service
+_in_flight = {}
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def token_expires_at(token: str) -> float:
+    """Запись живёт до exp токена, но не дольше TOKEN_CACHE_MAX_TTL"""
+    expires_at = time.time() + TOKEN_CACHE_MAX_TTL
+    # Claims ещё не проверены подписью: некорректный exp не должен ронять запрос
+    try:
+        exp = jwt.get_unverified_claims(token).get("exp")
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+    except (JWTError, AttributeError, TypeError, ValueError):
+        pass
+    return expires_at
+
+
+def _get_local(key: str):
+    entry = _local_cache.get(key)
+    if entry is None:
+        return None
+    user_id, expires_at = entry
+    if expires_at <= time.time():
+        del _local_cache[key]
+        return None
+    _local_cache.move_to_end(key)
+    return user_id
+
+
+def _set_local(key: str, user_id: int, expires_at: float):
+    _local_cache[key] = (user_id, expires_at)
+    _local_cache.move_to_end(key)
+    while len(_local_cache) > TOKEN_CACHE_SIZE:
+        _local_cache.popitem(last=False)
+
+
+async def _get_redis(key: str):
+    if redis_client is None:
+        return None
+    try:
+        user_id = await redis_client.get(f"delivery:token:{key}")
+    except redis.RedisError:
+        return None
+    return int(user_id) if user_id is not None else None
+
+
+async def _set_redis(key: str, user_id: int, expires_at: float):
+    if redis_client is None:
+        return
+    ttl = int(expires_at - time.time())
+    if ttl <= 0:
+        return
+    try:
+        await redis_client.set(f"delivery:token:{key}", user_id, ex=ttl)
+    except redis.RedisError:
+        pass
+
+
+async def _resolve(token: str, key: str, validator):
+    expires_at = token_expires_at(token)
+    user_id = await _get_redis(key)
+    if user_id is None:
+        user_id = await validator(token)
+        await _set_redis(key, user_id, expires_at)
+
+    if expires_at > time.time():
+        _set_local(key, user_id, expires_at)
+    return user_id
+
+
+async def get_or_validate(token: str, validator) -> int:
+    """Возвращает user_id из кэша; одновременные промахи по одному токену дают один запрос"""
+    key = token_hash(token)
+    user_id = _get_local(key)
+    if user_id is not None:
+        return user_id
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_resolve(token, key, validator))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+
+    # shield: отмена одного запроса не должна отменять проверку для остальных
+    return await asyncio.shield(task)
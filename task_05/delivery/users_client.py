@@ -0,0 +1,105 @@
+import aiohttp
+import time
+import os
+
+# Параметры пула соединений к users-service
+POOL_LIMIT = int(os.environ.get("USERS_HTTP_POOL_LIMIT", "100"))
+POOL_LIMIT_PER_HOST = int(os.environ.get("USERS_HTTP_POOL_LIMIT_PER_HOST", "50"))
+KEEPALIVE_TIMEOUT = float(os.environ.get("USERS_HTTP_KEEPALIVE_TIMEOUT", "30"))
+DNS_CACHE_TTL = int(os.environ.get("USERS_HTTP_DNS_CACHE_TTL", "300"))
+CONNECT_TIMEOUT = float(os.environ.get("USERS_HTTP_CONNECT_TIMEOUT", "2"))
+TOTAL_TIMEOUT = float(os.environ.get("USERS_HTTP_TOTAL_TIMEOUT", "5"))
+
+_session = None
+
+_stats = {
+    "requests_total": 0,
+    "requests_in_flight": 0,
+    "connections_created": 0,
+    "connections_reused": 0,
+    "queued_now": 0,
+    "queued_total": 0,
+    "queue_wait_seconds_total": 0.0,
+}
+
+
+async def _on_request_start(session, ctx, params):
+    _stats["requests_total"] += 1
+    _stats["requests_in_flight"] += 1
+
+
+async def _on_request_done(session, ctx, params):
+    _stats["requests_in_flight"] -= 1
+
+
+async def _on_connection_queued_start(session, ctx, params):
+    # Все соединения пула заняты - запрос ждёт освобождения
+    ctx.queued_at = time.monotonic()
+    _stats["queued_now"] += 1
+    _stats["queued_total"] += 1
+
+
+async def _on_connection_queued_end(session, ctx, params):
+    _stats["queued_now"] -= 1
+    _stats["queue_wait_seconds_total"] += time.monotonic() - ctx.queued_at
+
+
+async def _on_connection_create_end(session, ctx, params):
+    _stats["connections_created"] += 1
+
+
+async def _on_connection_reuseconn(session, ctx, params):
+    _stats["connections_reused"] += 1
+
+
+def _trace_config():
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_end.append(_on_request_done)
+    trace_config.on_request_exception.append(_on_request_done)
+    trace_config.on_connection_queued_start.append(_on_connection_queued_start)
+    trace_config.on_connection_queued_end.append(_on_connection_queued_end)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    return trace_config
+
+
+async def init_session():
+    """Создаёт общую на всё приложение сессию с пулом keep-alive соединений"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=DNS_CACHE_TTL,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=TOTAL_TIMEOUT, connect=CONNECT_TIMEOUT),
+            trace_configs=[_trace_config()],
+        )
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def get_session():
+    if _session is None or _session.closed:
+        return await init_session()
+    return _session
+
+
+def get_pool_stats():
+    """Метрики заполненности пула соединений к users-service"""
+    return {
+        **_stats,
+        "pool_limit": POOL_LIMIT,
+        "pool_limit_per_host": POOL_LIMIT_PER_HOST,
+        "saturation": _stats["requests_in_flight"] / POOL_LIMIT if POOL_LIMIT else 0.0,
+    }
@@ -56,6 +56,12 @@ db.deliveries.insertMany([
 
 db.deliveries.createIndex({ user_id: 1 });
 db.deliveries.createIndex({ status: 1 });
+// Курсорная пагинация /deliveries/list: сортировка по (created_at, _id)
+db.deliveries.createIndex({ status: 1, created_at: 1, _id: 1 });
+db.deliveries.createIndex({ created_at: 1, _id: 1 });
+// Список доставок владельца (scope=own): без фильтра по статусу и со статусом
+db.deliveries.createIndex({ user_id: 1, created_at: -1, _id: -1 });
+db.deliveries.createIndex({ user_id: 1, status: 1, created_at: -1, _id: -1 });
 
 
 db.createUser({
@@ -12,6 +12,13 @@ CREATE TABLE users (
 CREATE INDEX idx_users_username ON users(username);
 CREATE INDEX idx_users_name_surname ON users (name, surname);
 CREATE INDEX idx_users_surname ON users(surname);
+-- Keyset-пагинация /users/list?order=surname
+CREATE INDEX idx_users_surname_name_id ON users (surname, name, id);
+-- Нечёткий и префиксный поиск /users/search: триграммный индекс по
+-- объединённым полям (то же выражение используется в запросе)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX idx_users_search_trgm ON users
+    USING GIN ((username || ' ' || name || ' ' || surname || ' ' || email) gin_trgm_ops);
 
 
 INSERT INTO users (username, email, hashed_password, name, surname, age)
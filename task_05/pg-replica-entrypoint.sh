@@ -0,0 +1,22 @@
+#!/bin/bash
+# Запуск реплики (users-pg-replica): при пустом каталоге данных снимает копию
+# с primary через pg_basebackup, затем стартует в режиме hot standby.
+set -e
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    until pg_isready -h "$PRIMARY_HOST" -U "$REPLICATION_USER"; do
+        echo "Waiting for primary $PRIMARY_HOST..."
+        sleep 2
+    done
+
+    mkdir -p "$PGDATA"
+    chown postgres:postgres "$PGDATA"
+    chmod 700 "$PGDATA"
+
+    # -R создаёт standby.signal и primary_conninfo, -S - слот, созданный в pg-replication.sh
+    PGPASSWORD="$REPLICATION_PASSWORD" gosu postgres pg_basebackup \
+        -h "$PRIMARY_HOST" -U "$REPLICATION_USER" -D "$PGDATA" \
+        -X stream -S "$REPLICATION_SLOT" -R
+fi
+
+exec docker-entrypoint.sh postgres -c hot_standby=on
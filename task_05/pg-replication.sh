@@ -0,0 +1,11 @@
+#!/bin/bash
+# Подготовка primary (users-pg) к потоковой репликации: роль, слот и доступ в pg_hba.conf.
+# Выполняется один раз при инициализации базы, до pg-init.sql.
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
+    CREATE ROLE ${REPLICATION_USER} WITH REPLICATION LOGIN PASSWORD '${REPLICATION_PASSWORD}';
+    SELECT pg_create_physical_replication_slot('${REPLICATION_SLOT}');
+EOSQL
+
+echo "host replication ${REPLICATION_USER} all scram-sha-256" >> "$PGDATA/pg_hba.conf"
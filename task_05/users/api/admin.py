@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends
+import redis.asyncio
+
+from api.auth import get_current_admin
+from database.cache import get_redis, LIST_CACHE_GEN_KEY
+
+# Семейства ключей кэша, по которым собирается статистика
+CACHE_FAMILIES = ["users:get", "users:list", "users:search", "users:exists"]
+# Для TTL и объёма памяти берётся выборка ключей, а не все ключи семейства
+SAMPLE_SIZE = 200
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(get_current_admin)],
+)
+
+
+def ttl_bucket(ttl: int) -> str:
+    if ttl < 0:
+        return "no_ttl"
+    if ttl < 60:
+        return "<60s"
+    if ttl < 300:
+        return "60-300s"
+    return ">=300s"
+
+
+async def family_stats(redis: redis.asyncio.Redis, family: str) -> dict:
+    key_count = 0
+    sample = []
+    # SCAN обходит всё пространство ключей - только для служебного эндпоинта
+    async for key in redis.scan_iter(match=f"{family}:*", count=1000):
+        if key == LIST_CACHE_GEN_KEY:
+            continue
+        key_count += 1
+        if len(sample) < SAMPLE_SIZE:
+            sample.append(key)
+
+    ttl_distribution = {}
+    sample_memory = 0
+    if sample:
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in sample:
+                pipe.ttl(key)
+                pipe.memory_usage(key)
+            values = await pipe.execute()
+
+        for ttl, memory in zip(values[::2], values[1::2]):
+            # Ключ мог истечь между SCAN и pipeline
+            if ttl == -2:
+                continue
+            bucket = ttl_bucket(ttl)
+            ttl_distribution[bucket] = ttl_distribution.get(bucket, 0) + 1
+            sample_memory += memory or 0
+
+    average_memory = sample_memory / len(sample) if sample else 0
+    return {
+        "keys": key_count,
+        "sampled_keys": len(sample),
+        "ttl_distribution": ttl_distribution,
+        "approx_memory_bytes": int(average_memory * key_count),
+    }
+
+
+# GET /admin/cache/stats - Статистика кэша по семействам ключей
+@router.get("/cache/stats")
+async def get_cache_stats(redis: redis.asyncio.Redis = Depends(get_redis)):
+    memory_info = await redis.info("memory")
+    return {
+        "families": {family: await family_stats(redis, family) for family in CACHE_FAMILIES},
+        "list_generation": await redis.get(LIST_CACHE_GEN_KEY) or "0",
+        "used_memory_bytes": memory_info.get("used_memory"),
+        "maxmemory_bytes": memory_info.get("maxmemory"),
+    }
@@ -5,36 +5,141 @@ from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-
-from database.database import get_db
-from database import models
-
-SECRET_KEY = "your-secret-key"
-ALGORITHM = "HS256"
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import redis.asyncio
+import asyncio
+import os
+
+from database.database import get_db, read_session, cache_read_session, get_write_lsn
+from database.cache import get_redis, user_exists_key, USER_EXISTS_TTL
+from database.queries import USER_BY_ID, USER_BY_USERNAME
+from metrics import CACHE_HITS, CACHE_MISSES, CACHE_SETS
+
+SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key")
+ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Пользователи с доступом к служебным (/admin) эндпоинтам
+ADMIN_USER_IDS = {
+    int(user_id) for user_id in os.environ.get("ADMIN_USER_IDS", "1").split(",") if user_id.strip()
+}
+
+# bcrypt выполняется в отдельном пуле, чтобы не блокировать event loop.
+# thread - достаточно для bcrypt (отпускает GIL), process - для полной изоляции
+PASSWORD_HASH_EXECUTOR = os.environ.get("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Сколько операций может ждать в очереди сверх занятых воркеров, дальше - 503
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASH_QUEUE_SIZE", "64"))
+# Массовый импорт хэширует в собственном пуле, чтобы /token не ждал в одной очереди
+# с тысячами паролей импорта; задачи - небольшими пачками
+PASSWORD_IMPORT_WORKERS = int(
+    os.environ.get("PASSWORD_IMPORT_WORKERS", str(max(1, PASSWORD_HASH_WORKERS // 2)))
+)
+PASSWORD_IMPORT_BATCH_SIZE = int(os.environ.get("PASSWORD_IMPORT_BATCH_SIZE", "16"))
+
 router = APIRouter(tags=["authentication"])
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+_password_executor = None
+_import_executor = None
+_password_slots = None
+
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def make_password_executor(workers: int, name: str):
+    if PASSWORD_HASH_EXECUTOR == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+
+def get_password_executor():
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = make_password_executor(PASSWORD_HASH_WORKERS, "bcrypt")
+    return _password_executor
+
+
+def get_import_executor():
+    global _import_executor
+    if _import_executor is None:
+        _import_executor = make_password_executor(PASSWORD_IMPORT_WORKERS, "bcrypt-import")
+    return _import_executor
+
+
+def shutdown_password_executor():
+    global _password_executor, _import_executor
+    for executor in (_password_executor, _import_executor):
+        if executor is not None:
+            executor.shutdown(wait=False)
+    _password_executor = None
+    _import_executor = None
+
+
+async def run_password_task(func, *args):
+    """Запуск bcrypt в пуле с ограниченной очередью: при переполнении сразу отвечаем 503"""
+    global _password_slots
+    if _password_slots is None:
+        _password_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE)
+
+    if _password_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
+
+    async with _password_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_password_executor(), func, *args)
+
+
+async def hash_password(password):
+    return await run_password_task(get_password_hash, password)
+
+
+def get_password_hashes(passwords):
+    return [get_password_hash(password) for password in passwords]
+
+
+async def hash_passwords(passwords):
+    """Хэширование паролей импорта в отдельном пуле, небольшими пачками"""
+    loop = asyncio.get_running_loop()
+    step = PASSWORD_IMPORT_BATCH_SIZE
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(get_import_executor(), get_password_hashes, passwords[i:i + step])
+        for i in range(0, len(passwords), step)
+    ))
+    return [hashed for part in parts for hashed in part]
+
+
+async def check_password(plain_password, hashed_password):
+    return await run_password_task(verify_password, plain_password, hashed_password)
+
+
 async def get_user_by_username(db: AsyncSession, username: str):
-    result = await db.execute(select(models.User).filter(models.User.username == username))
+    result = await db.execute(USER_BY_USERNAME, {"username": username})
     return result.scalars().first()
 
 
-async def get_user_by_user_id(db: AsyncSession, user_id: str):
-    result = await db.execute(select(models.User).filter(models.User.id == user_id))
+async def get_user_by_user_id(db: AsyncSession, user_id: int):
+    result = await db.execute(USER_BY_ID, {"user_id": user_id})
     return result.scalars().first()
 
 
-async def get_current_client(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+async def get_current_client(
+    token: str = Depends(oauth2_scheme),
+    redis: redis.asyncio.Redis = Depends(get_redis)
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -46,16 +151,43 @@ async def get_current_client(token: str = Depends(oauth2_scheme), db: AsyncSessi
         if user_id is None:
             raise credentials_exception
         
-        # Проверка, существует ли пользователь
-        user = await get_user_by_user_id(db, user_id)
+        # Проверка, существует ли пользователь: сначала по кэшу, затем в Postgres
+        if await redis.exists(user_exists_key(user_id)):
+            CACHE_HITS.labels("users:exists").inc()
+            return user_id
+
+        CACHE_MISSES.labels("users:exists").inc()
+        # Результат кэшируется, поэтому реплика должна видеть все записи (в том числе удаление)
+        async with cache_read_session(redis) as session:
+            user = await get_user_by_user_id(session, user_id)
         if user is None:
             raise credentials_exception
-        
+
+        await redis.set(user_exists_key(user_id), 1, ex=USER_EXISTS_TTL)
+        CACHE_SETS.labels("users:exists").inc()
         return user.id
     except JWTError:
         raise credentials_exception
 
 
+async def get_read_db(
+    client_id: int = Depends(get_current_client),
+    redis: redis.asyncio.Redis = Depends(get_redis)
+):
+    """Сессия для чтения без кэша: реплика, если она уже видит последнюю запись этого клиента"""
+    async with read_session(await get_write_lsn(redis, client_id)) as session:
+        yield session
+
+
+async def get_current_admin(user_id: int = Depends(get_current_client)):
+    if user_id not in ADMIN_USER_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions",
+        )
+    return user_id
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -70,7 +202,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 @router.post("/token")
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     user = await get_user_by_username(db, form_data.username)
-    if not user or not pwd_context.verify(form_data.password, user.hashed_password):
+    if not user or not await check_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -85,9 +217,12 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 
 @router.post("/validate-token", tags=["authentication"])
-async def validate_token(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+async def validate_token(
+    token: str = Depends(oauth2_scheme),
+    redis: redis.asyncio.Redis = Depends(get_redis)
+):
     try:
-        user_id = await get_current_client(token, db)
+        user_id = await get_current_client(token, redis)
         return {"valid": True, "user_id": user_id}
     except HTTPException:
         raise HTTPException(
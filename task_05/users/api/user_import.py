@@ -0,0 +1,212 @@
+from fastapi import APIRouter, Depends, Request
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional
+from enum import Enum
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
+import redis.asyncio
+import json
+import csv
+import os
+
+from api.auth import get_current_client, hash_passwords
+from api.users import UserCreate
+from database.database import get_db, mark_write
+from database.cache import get_redis, invalidate_list_cache
+
+# Размер пачки строк, которая хэшируется и загружается одним COPY
+IMPORT_CHUNK_SIZE = int(os.getenv("USERS_IMPORT_CHUNK_SIZE", "1000"))
+
+# Наибольшее число строк файла в одной записи CSV (поле в кавычках с переводами строк)
+MAX_CSV_RECORD_LINES = 100
+
+STAGING_COLUMNS = ["line", "username", "email", "hashed_password", "name", "surname", "age"]
+
+# Промежуточная таблица: COPY не умеет пропускать конфликты, поэтому строки
+# сначала грузятся сюда, а в users переносятся через INSERT ... ON CONFLICT DO NOTHING
+CREATE_STAGING_SQL = text("""
+    CREATE TEMP TABLE IF NOT EXISTS users_import (
+        line INTEGER,
+        username VARCHAR,
+        email VARCHAR,
+        hashed_password TEXT,
+        name VARCHAR,
+        surname VARCHAR,
+        age INTEGER
+    ) ON COMMIT DELETE ROWS
+""")
+
+MOVE_STAGING_SQL = text("""
+    INSERT INTO users (username, email, hashed_password, name, surname, age)
+    SELECT username, email, hashed_password, name, surname, age
+    FROM users_import
+    ORDER BY line
+    ON CONFLICT DO NOTHING
+    RETURNING username
+""")
+
+
+class ImportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class ImportRowError(BaseModel):
+    line: int
+    detail: str
+
+
+class ImportResult(BaseModel):
+    inserted: int
+    errors: List[ImportRowError]
+
+
+router = APIRouter(
+    prefix="/users",
+    tags=["users"],
+    dependencies=[Depends(get_current_client)],
+)
+
+
+async def iter_lines(request: Request):
+    """Построчное чтение тела запроса без загрузки файла целиком в память.
+    Строки отдаются байтами: ошибка декодирования - ошибка одной строки, а не запроса"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+
+def format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()
+    )
+
+
+def parse_csv_record(record: str, header):
+    values = next(csv.reader([record]))
+    if header is None:
+        return values, None
+    row = dict(zip(header, values))
+    if row.get("age") == "":
+        row["age"] = None
+    return header, row
+
+
+async def iter_rows(request: Request, import_format: ImportFormat):
+    """Возвращает (номер строки, UserCreate или None, текст ошибки или None).
+    Запись CSV с переводом строки внутри кавычек собирается из нескольких строк
+    и получает номер первой из них"""
+    header = None
+    line_number = 0
+    # Строки незавершённой записи CSV (открытая кавычка) и номер её первой строки
+    pending = []
+    pending_line = 0
+    async for line in iter_lines(request):
+        line_number += 1
+        if not pending and not line.strip():
+            continue
+        row_line = pending_line if pending else line_number
+        try:
+            line = line.decode("utf-8")
+            if import_format == ImportFormat.CSV:
+                record = "\n".join(pending + [line])
+                # Нечётное число кавычек - поле в кавычках продолжается на следующей строке
+                if record.count('"') % 2:
+                    if not pending:
+                        pending_line = line_number
+                    pending.append(line)
+                    if len(pending) > MAX_CSV_RECORD_LINES:
+                        raise ValueError("Quoted field spans too many lines")
+                    continue
+                pending = []
+                header, row = parse_csv_record(record, header)
+                if row is None:
+                    continue
+            else:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("Expected a JSON object")
+            yield row_line, UserCreate(**row), None
+        except ValidationError as e:
+            pending = []
+            yield row_line, None, format_validation_error(e)
+        except (ValueError, csv.Error) as e:
+            pending = []
+            yield row_line, None, str(e)
+
+    if pending:
+        yield pending_line, None, "Unterminated quoted field"
+
+
+async def import_chunk(db: AsyncSession, redis, client_id: int, chunk, result: ImportResult):
+    hashes = await hash_passwords([user.password for _, user in chunk])
+    records = [
+        (line, user.username, user.email, hashed_password, user.name, user.surname, user.age)
+        for (line, user), hashed_password in zip(chunk, hashes)
+    ]
+
+    await db.execute(CREATE_STAGING_SQL)
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        "users_import", records=records, columns=STAGING_COLUMNS
+    )
+    moved = await db.execute(MOVE_STAGING_SQL)
+    inserted_usernames = set(moved.scalars().all())
+    await db.commit()
+    await mark_write(db, redis, client_id)
+
+    # Кэш списков сбрасывается после каждой зафиксированной пачки: если импорт
+    # прервётся, уже добавленные пользователи всё равно появятся в списках
+    if inserted_usernames:
+        await invalidate_list_cache(redis)
+
+    result.inserted += len(inserted_usernames)
+    for line, user in chunk:
+        if user.username not in inserted_usernames:
+            result.errors.append(ImportRowError(line=line, detail="Username or email already exists"))
+
+
+# POST /users/import - Массовый импорт пользователей из NDJSON или CSV
+@router.post("/import", response_model=ImportResult)
+async def import_users(
+    request: Request,
+    format: Optional[ImportFormat] = None,
+    db: AsyncSession = Depends(get_db),
+    redis: redis.asyncio.Redis = Depends(get_redis),
+    client_id: int = Depends(get_current_client)
+):
+    import_format = format
+    if import_format is None:
+        content_type = request.headers.get("content-type", "")
+        import_format = ImportFormat.CSV if "csv" in content_type else ImportFormat.NDJSON
+
+    result = ImportResult(inserted=0, errors=[])
+    seen_usernames = set()
+    seen_emails = set()
+    chunk = []
+
+    async for line, user, error in iter_rows(request, import_format):
+        if error:
+            result.errors.append(ImportRowError(line=line, detail=error))
+            continue
+        if user.username in seen_usernames or user.email in seen_emails:
+            result.errors.append(ImportRowError(line=line, detail="Duplicate username or email in import"))
+            continue
+        seen_usernames.add(user.username)
+        seen_emails.add(user.email)
+
+        chunk.append((line, user))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            await import_chunk(db, redis, client_id, chunk, result)
+            chunk = []
+
+    if chunk:
+        await import_chunk(db, redis, client_id, chunk, result)
+
+    return result
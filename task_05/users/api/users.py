@@ -1,23 +1,43 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
+from enum import Enum
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_, tuple_, bindparam, insert, text, Integer
+from sqlalchemy.exc import IntegrityError, DBAPIError
+import base64
 import json
+import time
+import orjson
 import redis.asyncio
-import os
 
-from api.auth import get_current_client, get_password_hash
-from database.database import get_db
+import settings
+from api.auth import get_current_client, get_read_db, hash_password
+from database.database import get_db, cache_read_session, mark_write
+from database.cache import (
+    get_redis,
+    user_exists_key,
+    get_list_generation,
+    invalidate_list_cache,
+    get_or_load,
+    user_key,
+    local_user_cache,
+    get_cached_users,
+    set_cached_user,
+    set_cached_users,
+    invalidate_user,
+)
 from database import models
-
-redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
-redis_client = redis.asyncio.from_url(redis_url, encoding="utf-8", decode_responses=True)
-
-async def get_redis():
-    return redis_client
+from database.queries import (
+    USER_PUBLIC_COLUMNS,
+    USER_BY_ID,
+    USER_PUBLIC_BY_ID,
+    USER_BY_EMAIL_OR_USERNAME,
+    USERS_BY_IDS,
+    USERS_SEARCH,
+)
+from metrics import CACHE_INVALIDATIONS
 
 class UserBase(BaseModel):
     name: str
@@ -40,6 +60,29 @@ class ListResponse(BaseModel):
     users: List[User]
     limit: int
     offset: int
+    next_cursor: Optional[str] = None
+
+class UserMatch(User):
+    score: float
+
+class SearchResponse(BaseModel):
+    users: List[UserMatch]
+    query: str
+    limit: int
+
+class UserOrder(str, Enum):
+    ID = "id"
+    SURNAME = "surname"
+
+# Колонки сортировки; последняя - id, чтобы порядок был строгим.
+# Для сортировки по фамилии есть индекс idx_users_surname_name_id
+ORDER_COLUMNS = {
+    UserOrder.ID: (models.User.id,),
+    UserOrder.SURNAME: (models.User.surname, models.User.name, models.User.id),
+}
+
+# Наибольший размер страницы /users/list
+MAX_PAGE_SIZE = 1000
 
 router = APIRouter(
     prefix="/users",
@@ -47,75 +90,160 @@ router = APIRouter(
     dependencies=[Depends(get_current_client)],
 )
 
+
+def encode_cursor(order: UserOrder, user) -> str:
+    values = [getattr(user, column.key) for column in ORDER_COLUMNS[order]]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(order: UserOrder, cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    columns = ORDER_COLUMNS[order]
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Значения уходят в типизированные параметры запроса: int для id, str для имени и фамилии
+    for value, column in zip(values, columns):
+        if isinstance(value, bool) or not isinstance(value, column.type.python_type):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+# Запросы списка для каждого набора фильтров строятся один раз;
+# значения фильтров, курсора, limit и offset передаются параметрами
+_list_queries = {}
+
+
+def get_list_query(order: UserOrder, by_username: bool, by_name: bool, by_surname: bool, by_cursor: bool):
+    key = (order, by_username, by_name, by_surname, by_cursor)
+    query = _list_queries.get(key)
+    if query is not None:
+        return query
+
+    filters = []
+
+    if by_username:
+        filters.append(models.User.username == bindparam("username"))
+
+    if by_name:
+        filters.append(models.User.name == bindparam("name"))
+
+    if by_surname:
+        filters.append(models.User.surname == bindparam("surname"))
+
+    columns = ORDER_COLUMNS[order]
+    if by_cursor:
+        # Поиск по индексу сразу с позиции курсора вместо пропуска offset строк
+        filters.append(tuple_(*columns) > tuple_(*(
+            bindparam(f"cursor_{i}", type_=column.type) for i, column in enumerate(columns)
+        )))
+
+    # Только публичные колонки: строки без ORM-гидрации и без hashed_password
+    query = select(*USER_PUBLIC_COLUMNS)
+    if filters:
+        query = query.filter(and_(*filters))
+
+    query = query.order_by(*columns).limit(bindparam("limit", type_=Integer))
+    if not by_cursor:
+        query = query.offset(bindparam("offset", type_=Integer))
+
+    _list_queries[key] = query
+    return query
+
+
+def build_users_query(
+    username: Optional[str],
+    name: Optional[str],
+    surname: Optional[str],
+    order: UserOrder,
+    cursor: Optional[str],
+    limit: int,
+    offset: int,
+):
+    """Запрос списка пользователей и его параметры: курсор (keyset) либо LIMIT/OFFSET, всегда с явной сортировкой"""
+    query = get_list_query(order, bool(username), bool(name), bool(surname), bool(cursor))
+
+    params = {"limit": limit}
+    if username:
+        params["username"] = username
+    if name:
+        params["name"] = name
+    if surname:
+        params["surname"] = surname
+    if cursor:
+        for i, value in enumerate(decode_cursor(order, cursor)):
+            params[f"cursor_{i}"] = value
+    else:
+        params["offset"] = offset
+    return query, params
+
+
+def build_list_response(users, order: UserOrder, limit: int, offset: int) -> ListResponse:
+    next_cursor = encode_cursor(order, users[-1]) if users and len(users) == limit else None
+    return ListResponse(
+        users=[user_to_dict(user) for user in users],
+        limit=limit,
+        offset=offset+limit,
+        next_cursor=next_cursor,
+    )
+
+def dump_json(data) -> str:
+    # В Redis (decode_responses=True) хранится строка - готовое тело ответа
+    return orjson.dumps(data).decode()
+
+
+def json_response(payload: str) -> Response:
+    """Ответ из уже сериализованного JSON, без повторной валидации через response_model"""
+    return Response(content=payload, media_type="application/json")
+
+
+def user_to_dict(user) -> dict:
+    return {
+        "id": user.id,
+        "name": user.name,
+        "surname": user.surname,
+        "email": user.email,
+        "age": user.age,
+        "username": user.username
+    }
+
 # GET /users/list - Получить всех пользователей
 @router.get("/list", response_model=ListResponse)
 async def get_users(
     username: Optional[str] = None, 
     name: Optional[str] = None, 
     surname: Optional[str] = None,
-    limit: int = 50,
-    offset: int = 0,
-    db: AsyncSession = Depends(get_db),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    order: UserOrder = UserOrder.ID,
+    cursor: Optional[str] = None,
     redis: redis.asyncio.Redis = Depends(get_redis)
 ):
-    cache_key = f"users:list:{username}:{name}:{surname}:{limit}:{offset}"
-    
-    cached_data = await redis.get(cache_key)
-    if cached_data:
-        cached_list = json.loads(cached_data)
-        return ListResponse(
-            users=[User(**user) for user in cached_list["users"]],
-            limit=cached_list["limit"],
-            offset=cached_list["offset"]
-        )
-    
-    query = select(models.User)
+    generation = await get_list_generation(redis)
+    cache_key = f"users:list:{generation}:{username}:{name}:{surname}:{limit}:{offset}:{order.value}:{cursor}"
 
-    filters = []
-    
-    if username:
-        filters.append(models.User.username == username)
+    # Курсор проверяется до обращения к кэшу, чтобы ошибка не попала в фоновую загрузку
+    if cursor:
+        decode_cursor(order, cursor)
 
-    if name:
-        filters.append(models.User.name == name)
-    
-    if surname:
-        filters.append(models.User.surname == surname)
+    async def load_users():
+        query, params = build_users_query(username, name, surname, order, cursor, limit, offset)
+        async with cache_read_session(redis) as session:
+            result = await session.execute(query, params)
+            users = result.all()
 
-    if filters:
-        query = query.filter(and_(*filters))
+        cache_data = {
+            "users": [user_to_dict(user) for user in users],
+            "limit": limit,
+            "offset": offset+limit,
+            "next_cursor": encode_cursor(order, users[-1]) if users and len(users) == limit else None,
+        }
+        return dump_json(cache_data)
 
-    query = query.limit(limit).offset(offset)
-    result = await db.execute(query)
-    users = result.scalars().all()
-    
-    response = ListResponse(
-        users=users,
-        limit=limit,
-        offset=offset+limit,
-    )
-    
-    users_dict = [
-        {
-            "id": user.id,
-            "name": user.name,
-            "surname": user.surname, 
-            "email": user.email,
-            "age": user.age,
-            "username": user.username
-        } 
-        for user in users
-    ]
-    
-    cache_data = {
-        "users": users_dict,
-        "limit": limit,
-        "offset": offset+limit
-    }
-    
-    await redis.set(cache_key, json.dumps(cache_data), ex=300)
-    
-    return response
+    # В кэше лежит итоговое тело ответа: при попадании Pydantic не участвует
+    return json_response(await get_or_load(redis, "users:list", cache_key, load_users))
 
 # GET /users/list-no-cache - Получить всех пользователей (без кеша)
 @router.get("/list-no-cache", response_model=ListResponse)
@@ -123,92 +251,143 @@ async def get_users_no_cache(
     username: Optional[str] = None, 
     name: Optional[str] = None, 
     surname: Optional[str] = None,
-    limit: int = 50,
-    offset: int = 0,
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    order: UserOrder = UserOrder.ID,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    query = select(models.User)
-
-    filters = []
+    query, params = build_users_query(username, name, surname, order, cursor, limit, offset)
+    result = await db.execute(query, params)
+    users = result.all()
     
-    if username:
-        filters.append(models.User.username == username)
+    return build_list_response(users, order, limit, offset)
 
-    if name:
-        filters.append(models.User.name == name)
-    
-    if surname:
-        filters.append(models.User.surname == surname)
+MAX_SEARCH_LIMIT = 100
 
-    if filters:
-        query = query.filter(and_(*filters))
+# SET LOCAL не принимает параметры запроса, значения подставляются в текст
+SEARCH_SETTINGS = [
+    text(f"SET LOCAL statement_timeout = {settings.SEARCH_TIMEOUT_MS}"),
+    text(f"SET LOCAL pg_trgm.word_similarity_threshold = {settings.SEARCH_SIMILARITY_THRESHOLD}"),
+]
 
-    query = query.limit(limit).offset(offset)
-    result = await db.execute(query)
-    users = result.scalars().all()
-    
-    return ListResponse(
-        users=users,
-        limit=limit,
-        offset=offset+limit,
-    )
+
+# GET /users/search - Нечёткий и префиксный поиск по username, имени, фамилии и email
+@router.get("/search", response_model=SearchResponse)
+async def search_users(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+    redis: redis.asyncio.Redis = Depends(get_redis)
+):
+    # Триграммы не зависят от регистра, поэтому и ключ кэша тоже
+    q = " ".join(q.lower().split())
+    generation = await get_list_generation(redis)
+    cache_key = f"users:search:{generation}:{limit}:{q}"
+
+    async def load_results():
+        # Транзакция не фиксируется: SET LOCAL действует до отката при закрытии сессии
+        async with cache_read_session(redis) as session:
+            for statement in SEARCH_SETTINGS:
+                await session.execute(statement)
+            result = await session.execute(USERS_SEARCH, {"q": q, "limit": limit})
+            rows = result.all()
+
+        return dump_json({
+            "users": [{**user_to_dict(row), "score": round(row.score, 4)} for row in rows],
+            "query": q,
+            "limit": limit,
+        })
+
+    try:
+        return json_response(await get_or_load(redis, "users:search", cache_key, load_results))
+    except DBAPIError as e:
+        # 57014 - query_canceled: запрос не уложился в statement_timeout
+        if getattr(e.orig, "sqlstate", None) == "57014":
+            raise HTTPException(status_code=503, detail="Search timed out, refine the query")
+        raise
+
+# Максимальное число ID в одном запросе /users/get-many
+MAX_BATCH_SIZE = 100
+
+
+# GET /users/get-many - Получить нескольких пользователей по списку ID
+@router.get("/get-many", response_model=List[User])
+async def get_users_many(
+    ids: List[int] = Query(...),
+    redis: redis.asyncio.Redis = Depends(get_redis)
+):
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} ids per request")
+
+    # Локальный кэш, затем все остальные попадания - одним MGET
+    cached_users = await get_cached_users(redis, ids)
+
+    found = dict(cached_users)
+    misses = [user_id for user_id in ids if user_id not in found]
+
+    if misses:
+        # Все промахи - одним запросом WHERE id = ANY(:ids)
+        start = time.perf_counter()
+        async with cache_read_session(redis) as session:
+            result = await session.execute(USERS_BY_IDS, {"ids": misses})
+            users = result.all()
+        load_time = time.perf_counter() - start
+
+        # И дозаполняем кэш одним pipeline
+        loaded = {user.id: dump_json(user_to_dict(user)) for user in users}
+        await set_cached_users(redis, loaded, delta=load_time)
+        found.update(loaded)
+
+    # Порядок ответа совпадает с порядком запрошенных ID, отсутствующие пропускаются.
+    # Массив собирается из готовых JSON-объектов без разбора и повторной сериализации
+    return json_response("[" + ",".join(found[user_id] for user_id in ids if user_id in found) + "]")
 
 # GET /users/get - Получить пользователя по ID
 @router.get("/get", response_model=User)
 async def get_user(
     user_id: int, 
-    db: AsyncSession = Depends(get_db),
     redis: redis.asyncio.Redis = Depends(get_redis)
 ):
-    cache_key = f"users:get:{user_id}"
-    cached_user = await redis.get(cache_key)
-    
-    if cached_user:
-        user_data = json.loads(cached_user)
-        return User(**user_data)
-    
-    result = await db.execute(select(models.User).filter(models.User.id == user_id))
-    user = result.scalars().first()
-    if not user:
+    async def load_user():
+        async with cache_read_session(redis) as session:
+            result = await session.execute(USER_PUBLIC_BY_ID, {"user_id": user_id})
+            user = result.first()
+        if not user:
+            return None
+        return dump_json(user_to_dict(user))
+
+    cached_user = await get_or_load(
+        redis, "users:get", user_key(user_id), load_user, local_cache=local_user_cache
+    )
+    if cached_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    user_data = {
-        "id": user.id,
-        "name": user.name,
-        "surname": user.surname,
-        "email": user.email,
-        "age": user.age,
-        "username": user.username
-    }
-    await redis.set(cache_key, json.dumps(user_data), ex=300)
-    
-    return user
+
+    return json_response(cached_user)
 
 # GET /users/get-no-cache - Получить пользователя по ID (без кеша)
 @router.get("/get-no-cache", response_model=User)
 async def get_user_no_cache(
     user_id: int, 
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    result = await db.execute(select(models.User).filter(models.User.id == user_id))
-    user = result.scalars().first()
+    result = await db.execute(USER_PUBLIC_BY_ID, {"user_id": user_id})
+    user = result.first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return user
+    return user_to_dict(user)
 
 # POST /users/create - Создать нового пользователя
 @router.post("/create", response_model=User, status_code=status.HTTP_201_CREATED)
 async def create_user(
     user_data: UserCreate, 
     db: AsyncSession = Depends(get_db),
-    redis: redis.asyncio.Redis = Depends(get_redis)
+    redis: redis.asyncio.Redis = Depends(get_redis),
+    client_id: int = Depends(get_current_client)
 ):
     result = await db.execute(
-        select(models.User).filter(
-            (models.User.email == user_data.email) | 
-            (models.User.username == user_data.username)
-        )
+        USER_BY_EMAIL_OR_USERNAME, {"email": user_data.email, "username": user_data.username}
     )
     existing_user = result.scalars().first()
     if existing_user:
@@ -217,38 +396,38 @@ async def create_user(
         else:
             raise HTTPException(status_code=400, detail="Username already taken")
 
-    hashed_password = get_password_hash(user_data.password)
-    db_user = models.User(
-        name=user_data.name,
-        surname=user_data.surname,
-        email=user_data.email,
-        age=user_data.age,
-        username=user_data.username,
-        hashed_password=hashed_password
+    hashed_password = await hash_password(user_data.password)
+    # INSERT ... RETURNING id: ответ собирается из переданных данных без повторного SELECT
+    result = await db.execute(
+        insert(models.User)
+        .values(
+            name=user_data.name,
+            surname=user_data.surname,
+            email=user_data.email,
+            age=user_data.age,
+            username=user_data.username,
+            hashed_password=hashed_password
+        )
+        .returning(models.User.id)
     )
-    
-    db.add(db_user)
+    user_id = result.scalar_one()
     await db.commit()
-    await db.refresh(db_user)
+    # LSN записи сохраняется до сброса кэша: загрузчики после сброса её уже учитывают
+    await mark_write(db, redis, client_id)
     
-    keys_to_delete = []
-    async for key in redis.scan_iter("users:list:*"):
-        keys_to_delete.append(key)
+    await invalidate_list_cache(redis)
     
-    if keys_to_delete:
-        await redis.delete(*keys_to_delete)
-    
-    user_data = {
-        "id": db_user.id,
-        "name": db_user.name,
-        "surname": db_user.surname,
-        "email": db_user.email,
-        "age": db_user.age,
-        "username": db_user.username
+    created_user = {
+        "id": user_id,
+        "name": user_data.name,
+        "surname": user_data.surname,
+        "email": user_data.email,
+        "age": user_data.age,
+        "username": user_data.username
     }
-    await redis.set(f"users:get:{db_user.id}", json.dumps(user_data), ex=300)
+    await set_cached_user(redis, user_id, dump_json(created_user))
     
-    return db_user
+    return created_user
 
 # PUT /users/update - Обновить пользователя по ID
 @router.put("/update", response_model=User)
@@ -256,9 +435,10 @@ async def update_user(
     user_id: int, 
     user_data: UserBase, 
     db: AsyncSession = Depends(get_db),
-    redis: redis.asyncio.Redis = Depends(get_redis)
+    redis: redis.asyncio.Redis = Depends(get_redis),
+    client_id: int = Depends(get_current_client)
 ):
-    result = await db.execute(select(models.User).filter(models.User.id == user_id))
+    result = await db.execute(USER_BY_ID, {"user_id": user_id})
     db_user = result.scalars().first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -269,16 +449,12 @@ async def update_user(
     db_user.age = user_data.age
     try:
         await db.commit()
+        await mark_write(db, redis, client_id)
         await db.refresh(db_user)
         
-        await redis.delete(f"users:get:{user_id}")
-        
-        keys_to_delete = []
-        async for key in redis.scan_iter("users:list:*"):
-            keys_to_delete.append(key)
+        await invalidate_user(redis, user_id)
         
-        if keys_to_delete:
-            await redis.delete(*keys_to_delete)
+        await invalidate_list_cache(redis)
         
         updated_user = {
             "id": db_user.id,
@@ -288,7 +464,7 @@ async def update_user(
             "age": db_user.age,
             "username": db_user.username
         }
-        await redis.set(f"users:get:{user_id}", json.dumps(updated_user), ex=300)
+        await set_cached_user(redis, user_id, dump_json(updated_user))
         
     except IntegrityError as e:
         await db.rollback()
@@ -303,9 +479,10 @@ async def update_user(
 async def delete_user(
     user_id: int, 
     db: AsyncSession = Depends(get_db),
-    redis: redis.asyncio.Redis = Depends(get_redis)
+    redis: redis.asyncio.Redis = Depends(get_redis),
+    client_id: int = Depends(get_current_client)
 ):
-    result = await db.execute(select(models.User).filter(models.User.id == user_id))
+    result = await db.execute(USER_BY_ID, {"user_id": user_id})
     db_user = result.scalars().first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -321,14 +498,12 @@ async def delete_user(
     
     await db.delete(db_user)
     await db.commit()
+    await mark_write(db, redis, client_id)
     
-    await redis.delete(f"users:get:{user_id}")
-    
-    keys_to_delete = []
-    async for key in redis.scan_iter("users:list:*"):
-        keys_to_delete.append(key)
+    await invalidate_user(redis, user_id)
+    await redis.delete(user_exists_key(user_id))
+    CACHE_INVALIDATIONS.labels("users:exists").inc()
     
-    if keys_to_delete:
-        await redis.delete(*keys_to_delete)
+    await invalidate_list_cache(redis)
     
     return user_data
@@ -0,0 +1,68 @@
+"""Микробенчмарк чтения страницы пользователей: строк в секунду для
+ORM-объектов (select(models.User)) и выборки колонок (USER_PUBLIC_COLUMNS).
+
+Запуск внутри контейнера users-service:
+    docker compose exec users-service python benchmark_rows.py
+    docker compose exec users-service python benchmark_rows.py --iterations 500
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy.future import select
+
+from database.database import AsyncSessionLocal, engine
+from database.queries import USER_PUBLIC_COLUMNS
+from database import models
+
+PAGE_SIZES = (50, 1000)
+
+
+def user_to_dict(user) -> dict:
+    return {
+        "id": user.id,
+        "name": user.name,
+        "surname": user.surname,
+        "email": user.email,
+        "age": user.age,
+        "username": user.username
+    }
+
+
+async def fetch_orm(session, limit: int) -> list:
+    result = await session.execute(select(models.User).order_by(models.User.id).limit(limit))
+    return [user_to_dict(user) for user in result.scalars().all()]
+
+
+async def fetch_columns(session, limit: int) -> list:
+    result = await session.execute(select(*USER_PUBLIC_COLUMNS).order_by(models.User.id).limit(limit))
+    return [user_to_dict(user) for user in result.all()]
+
+
+async def measure(fetch, limit: int, iterations: int) -> float:
+    rows = 0
+    # Прогрев: соединение, компиляция запроса, подготовленный statement
+    async with AsyncSessionLocal() as session:
+        await fetch(session, limit)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        # Новая сессия на каждую итерацию, как в обработчике запроса
+        async with AsyncSessionLocal() as session:
+            rows += len(await fetch(session, limit))
+    return rows / (time.perf_counter() - start)
+
+
+async def main(iterations: int):
+    print(f"{'page':>6} {'orm rows/s':>14} {'columns rows/s':>16} {'speedup':>8}")
+    for limit in PAGE_SIZES:
+        orm_rate = await measure(fetch_orm, limit, iterations)
+        columns_rate = await measure(fetch_columns, limit, iterations)
+        print(f"{limit:>6} {orm_rate:>14.0f} {columns_rate:>16.0f} {columns_rate / orm_rate:>7.2f}x")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    asyncio.run(main(parser.parse_args().iterations))
@@ -0,0 +1,340 @@
+from collections import OrderedDict
+import redis.asyncio
+import asyncio
+import logging
+import random
+import math
+import time
+import os
+
+from metrics import (
+    CACHE_HITS,
+    CACHE_MISSES,
+    CACHE_SETS,
+    CACHE_INVALIDATIONS,
+    CACHE_STALE_SERVED,
+    CACHE_COALESCED,
+    CACHE_EARLY_REFRESHES,
+)
+
+logger = logging.getLogger(__name__)
+
+redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+redis_client = redis.asyncio.from_url(redis_url, encoding="utf-8", decode_responses=True)
+
+# TTL отметки о существовании пользователя (для проверки токена)
+USER_EXISTS_TTL = int(os.getenv("USER_EXISTS_CACHE_TTL", "300"))
+
+
+class CachePolicy:
+    """Параметры хранения для семейства ключей.
+
+    ttl - базовое время жизни; jitter - доля случайного разброса TTL, чтобы записи,
+    созданные одновременно, не истекали одновременно; beta - коэффициент
+    вероятностного раннего обновления (XFetch), 0 - выключено; delta - оценка
+    времени загрузки (секунды) для записей, сохранённых без замера (после записи в БД).
+    """
+
+    def __init__(self, ttl: int, jitter: float, beta: float, delta: float):
+        self.ttl = ttl
+        self.jitter = jitter
+        self.beta = beta
+        self.delta = delta
+
+    @classmethod
+    def from_env(cls, prefix: str, ttl: int = 300, delta: float = 0.01):
+        return cls(
+            ttl=int(os.getenv(f"{prefix}_TTL", str(ttl))),
+            jitter=float(os.getenv(f"{prefix}_TTL_JITTER", "0.1")),
+            beta=float(os.getenv(f"{prefix}_XFETCH_BETA", "1.0")),
+            delta=float(os.getenv(f"{prefix}_XFETCH_DELTA", str(delta))),
+        )
+
+    def next_ttl(self) -> float:
+        return self.ttl * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+CACHE_POLICIES = {
+    "users:get": CachePolicy.from_env("USERS_CACHE_GET"),
+    "users:list": CachePolicy.from_env("USERS_CACHE_LIST"),
+    "users:search": CachePolicy.from_env("USERS_CACHE_SEARCH", ttl=60),
+}
+
+# stale-while-revalidate: после истечения TTL ещё STALE_TTL секунд отдаём
+# устаревшее значение, пока одна фоновая задача перечитывает его из БД
+STALE_WHILE_REVALIDATE = os.getenv("USERS_CACHE_STALE_WHILE_REVALIDATE", "false").lower() == "true"
+STALE_TTL = int(os.getenv("USERS_CACHE_STALE_TTL", "60"))
+
+# Локальный (в памяти процесса) уровень кэша перед Redis для /users/get
+LOCAL_CACHE_SIZE = int(os.getenv("USERS_LOCAL_CACHE_SIZE", "10000"))
+LOCAL_CACHE_TTL = float(os.getenv("USERS_LOCAL_CACHE_TTL", "10"))
+# Канал, через который воркеры узнают об изменении пользователя
+INVALIDATION_CHANNEL = "users:invalidate"
+
+
+class LocalCache:
+    """LRU-кэш процесса с ограничением размера и TTL записей"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+local_user_cache = LocalCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL)
+
+
+async def get_redis():
+    return redis_client
+
+
+def user_exists_key(user_id: int) -> str:
+    return f"users:exists:{user_id}"
+
+
+def user_key(user_id: int) -> str:
+    return f"users:get:{user_id}"
+
+
+def pack(payload: str, ttl: float, delta: float) -> str:
+    """В Redis рядом с данными хранятся момент истечения их свежести
+    и время, которое заняла их загрузка (нужно для XFetch)"""
+    return f"{time.time() + ttl:.3f}|{delta:.4f}|{payload}"
+
+
+def unpack(value: str):
+    """Возвращает (данные, момент истечения, время загрузки) или None для записи в неизвестном формате"""
+    parts = value.split("|", 2)
+    if len(parts) != 3:
+        return None
+    try:
+        return parts[2], float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+
+
+def redis_ttl(ttl: float) -> int:
+    # При stale-while-revalidate запись живёт в Redis дольше, чем остаётся свежей
+    ttl = math.ceil(ttl)
+    return ttl + STALE_TTL if STALE_WHILE_REVALIDATE else ttl
+
+
+def should_refresh_early(expires_at: float, delta: float, beta: float) -> bool:
+    """XFetch: чем ближе истечение и чем дороже загрузка, тем вероятнее раннее обновление"""
+    if beta <= 0 or delta <= 0:
+        return False
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+class SingleFlight:
+    """Одновременные загрузки одного ключа выполняются один раз, остальные ждут результат"""
+
+    def __init__(self):
+        self._calls = {}
+
+    def in_flight(self, key) -> bool:
+        return key in self._calls
+
+    async def do(self, key, func):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield: отмена одного запроса не отменяет загрузку для остальных
+        return await asyncio.shield(task)
+
+
+single_flight = SingleFlight()
+
+
+async def set_cached(redis, family: str, key: str, payload: str, local_cache=None, delta: float = None):
+    policy = CACHE_POLICIES[family]
+    ttl = policy.next_ttl()
+    if delta is None:
+        delta = policy.delta
+    await redis.set(key, pack(payload, ttl, delta), ex=redis_ttl(ttl))
+    if local_cache is not None:
+        local_cache.set(key, payload)
+    CACHE_SETS.labels(family).inc()
+
+
+async def _load_and_store(redis, family, key, loader, local_cache):
+    start = time.perf_counter()
+    payload = await loader()
+    if payload is not None:
+        await set_cached(redis, family, key, payload, local_cache, delta=time.perf_counter() - start)
+    return payload
+
+
+def _log_refresh_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background cache refresh failed", exc_info=task.exception())
+
+
+def _refresh_in_background(redis, family, key, loader, local_cache):
+    if single_flight.in_flight(key):
+        return
+    task = asyncio.ensure_future(
+        single_flight.do(key, lambda: _load_and_store(redis, family, key, loader, local_cache))
+    )
+    task.add_done_callback(_log_refresh_error)
+
+
+async def get_or_load(redis, family: str, key: str, loader, local_cache=None):
+    """Cache-aside: локальный кэш (если задан), Redis, затем loader.
+
+    loader - корутина без аргументов, возвращает JSON-строку или None (не найдено,
+    не кэшируется). Она открывает собственную сессию БД, так как может выполняться
+    после завершения запроса (фоновое обновление) или для нескольких запросов сразу.
+    """
+    if local_cache is not None:
+        payload = local_cache.get(key)
+        if payload is not None:
+            CACHE_HITS.labels(f"{family}:local").inc()
+            return payload
+        CACHE_MISSES.labels(f"{family}:local").inc()
+
+    value = await redis.get(key)
+    entry = unpack(value) if value is not None else None
+    if entry is not None:
+        payload, expires_at, delta = entry
+        if expires_at > time.time():
+            CACHE_HITS.labels(family).inc()
+            # Запись ещё свежая, но её обновление начинается заранее со случайной
+            # вероятностью - так обновления одновременно созданных записей расходятся во времени
+            if should_refresh_early(expires_at, delta, CACHE_POLICIES[family].beta):
+                CACHE_EARLY_REFRESHES.labels(family).inc()
+                _refresh_in_background(redis, family, key, loader, local_cache)
+            if local_cache is not None:
+                local_cache.set(key, payload)
+            return payload
+        if STALE_WHILE_REVALIDATE:
+            # Отдаём устаревшее значение, обновление - одной фоновой задачей
+            CACHE_HITS.labels(family).inc()
+            CACHE_STALE_SERVED.labels(family).inc()
+            _refresh_in_background(redis, family, key, loader, local_cache)
+            return payload
+
+    CACHE_MISSES.labels(family).inc()
+    if single_flight.in_flight(key):
+        CACHE_COALESCED.labels(family).inc()
+    return await single_flight.do(
+        key, lambda: _load_and_store(redis, family, key, loader, local_cache)
+    )
+
+
+async def get_cached_users(redis, user_ids: list) -> dict:
+    """Свежие записи users:get для списка ID: локальный кэш, затем один MGET.
+    Попадания и промахи обоих уровней учитываются здесь"""
+    found = {}
+    remote_ids = []
+    for user_id in user_ids:
+        value = local_user_cache.get(user_key(user_id))
+        if value is not None:
+            found[user_id] = value
+        else:
+            remote_ids.append(user_id)
+    CACHE_HITS.labels("users:get:local").inc(len(found))
+    CACHE_MISSES.labels("users:get:local").inc(len(remote_ids))
+
+    if remote_ids:
+        values = await redis.mget([user_key(user_id) for user_id in remote_ids])
+        redis_hits = 0
+        for user_id, value in zip(remote_ids, values):
+            entry = unpack(value) if value is not None else None
+            if entry is not None and entry[1] > time.time():
+                local_user_cache.set(user_key(user_id), entry[0])
+                found[user_id] = entry[0]
+                redis_hits += 1
+        # Как в get_or_load: users:get считает только обращения к Redis
+        CACHE_HITS.labels("users:get").inc(redis_hits)
+        CACHE_MISSES.labels("users:get").inc(len(remote_ids) - redis_hits)
+    return found
+
+
+async def set_cached_user(redis, user_id: int, payload: str):
+    await set_cached(redis, "users:get", user_key(user_id), payload, local_cache=local_user_cache)
+
+
+async def set_cached_users(redis, payloads: dict, delta: float = None):
+    """delta - время запроса, которым загружены записи (для XFetch)"""
+    policy = CACHE_POLICIES["users:get"]
+    if delta is None:
+        delta = policy.delta
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_id, payload in payloads.items():
+            ttl = policy.next_ttl()
+            pipe.set(user_key(user_id), pack(payload, ttl, delta), ex=redis_ttl(ttl))
+        await pipe.execute()
+    for user_id, payload in payloads.items():
+        local_user_cache.set(user_key(user_id), payload)
+    CACHE_SETS.labels("users:get").inc(len(payloads))
+
+
+async def invalidate_user(redis, user_id: int):
+    """Удаляет пользователя из Redis и из локальных кэшей всех воркеров"""
+    key = user_key(user_id)
+    local_user_cache.delete(key)
+    await redis.delete(key)
+    await redis.publish(INVALIDATION_CHANNEL, key)
+    CACHE_INVALIDATIONS.labels("users:get").inc()
+
+
+async def listen_for_invalidations():
+    """Фоновая задача: сбрасывает локальные записи по сообщениям из Redis pub/sub"""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Пока подписки не было, сообщения могли быть пропущены
+            local_user_cache.clear()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    local_user_cache.delete(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except redis.RedisError:
+            logger.exception("Lost subscription to %s, reconnecting", INVALIDATION_CHANNEL)
+            local_user_cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.close()
+
+
+# Версия (поколение) кэша списков и поиска: запись увеличивает счётчик,
+# старые ключи users:list:{gen}:* и users:search:{gen}:* больше не читаются и истекают по TTL
+LIST_CACHE_GEN_KEY = "users:list:gen"
+
+
+async def get_list_generation(redis) -> str:
+    return await redis.get(LIST_CACHE_GEN_KEY) or "0"
+
+
+async def invalidate_list_cache(redis):
+    await redis.incr(LIST_CACHE_GEN_KEY)
+    CACHE_INVALIDATIONS.labels("users:list").inc()
+    CACHE_INVALIDATIONS.labels("users:search").inc()
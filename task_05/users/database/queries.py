@@ -0,0 +1,47 @@
+from sqlalchemy import select, bindparam, any_, text, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from database import models
+
+# Часто выполняемые запросы собираются один раз при импорте, значения передаются
+# параметрами при выполнении. Объект запроса не строится заново на каждый запрос,
+# а ключ кэша скомпилированного SQL вычисляется для него один раз и переиспользуется
+
+# Колонки, которые отдаются клиентам (без hashed_password). Запросы только на чтение
+# выбирают их напрямую и получают строки (Row) без создания ORM-объектов и identity map
+USER_PUBLIC_COLUMNS = (
+    models.User.id,
+    models.User.name,
+    models.User.surname,
+    models.User.email,
+    models.User.age,
+    models.User.username,
+)
+
+USER_BY_ID = select(models.User).where(models.User.id == bindparam("user_id", type_=Integer))
+
+USER_PUBLIC_BY_ID = select(*USER_PUBLIC_COLUMNS).where(
+    models.User.id == bindparam("user_id", type_=Integer)
+)
+
+USER_BY_USERNAME = select(models.User).where(models.User.username == bindparam("username"))
+
+USER_BY_EMAIL_OR_USERNAME = select(models.User).where(
+    (models.User.email == bindparam("email")) | (models.User.username == bindparam("username"))
+)
+
+# WHERE id = ANY(:ids) - один запрос и один подготовленный statement для любого числа ID
+USERS_BY_IDS = select(*USER_PUBLIC_COLUMNS).where(
+    models.User.id == any_(bindparam("ids", type_=ARRAY(Integer)))
+)
+
+# Поиск по триграммам: q <% документ использует индекс idx_users_search_trgm,
+# выражение документа должно совпадать с выражением индекса в pg-init.sql
+USERS_SEARCH = text("""
+    SELECT id, name, surname, email, age, username,
+           word_similarity(:q, username || ' ' || name || ' ' || surname || ' ' || email) AS score
+    FROM users
+    WHERE :q <% (username || ' ' || name || ' ' || surname || ' ' || email)
+    ORDER BY score DESC, id
+    LIMIT :limit
+""")
@@ -1,22 +1,39 @@
 import contextlib
+import asyncio
+import logging
 import json
 
 from fastapi import FastAPI
 import uvicorn
 
-
-from api.auth import router as auth_router
+import settings
+from api.auth import router as auth_router, shutdown_password_executor
 from api.users import router as users_router
+from api.user_import import router as user_import_router
+from api.admin import router as admin_router
+from database.cache import listen_for_invalidations
+from database.database import check_replica_lag
+from metrics import router as metrics_router, metrics_middleware
+
+logging.basicConfig(level=settings.LOG_LEVEL)
 
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
     with open("openapi.json", "w") as f:
         json.dump(app.openapi(), f)
+    invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    replica_lag_checker = asyncio.create_task(check_replica_lag())
     yield
+    for task in (invalidation_listener, replica_lag_checker):
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    shutdown_password_executor()
 
 
 app = FastAPI(lifespan=lifespan)
+app.middleware("http")(metrics_middleware)
 
 
 @app.get("/")
@@ -26,7 +43,10 @@ async def read_root():
 
 app.include_router(auth_router)
 app.include_router(users_router)
+app.include_router(user_import_router)
+app.include_router(admin_router)
+app.include_router(metrics_router)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8082)
+    uvicorn.run(app, host="0.0.0.0", port=8082, log_level=settings.LOG_LEVEL.lower())
@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Request, Response
+from sqlalchemy import event
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+import time
+
+from database.database import engine, read_engines, replica_lag, TimedQueuePool
+
+REQUEST_COUNT = Counter(
+    "http_requests_total", "Number of HTTP requests", ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed", ["method"]
+)
+
+CACHE_HITS = Counter("users_cache_hits_total", "Redis cache hits", ["family"])
+CACHE_MISSES = Counter("users_cache_misses_total", "Redis cache misses", ["family"])
+CACHE_SETS = Counter("users_cache_sets_total", "Redis cache writes", ["family"])
+CACHE_INVALIDATIONS = Counter(
+    "users_cache_invalidations_total", "Redis cache invalidations", ["family"]
+)
+CACHE_STALE_SERVED = Counter(
+    "users_cache_stale_served_total", "Stale values served while refreshing", ["family"]
+)
+CACHE_COALESCED = Counter(
+    "users_cache_coalesced_total", "Cache misses that joined an in-flight load", ["family"]
+)
+CACHE_EARLY_REFRESHES = Counter(
+    "users_cache_early_refreshes_total", "Probabilistic early refreshes (XFetch)", ["family"]
+)
+
+DB_POOL_SIZE = Gauge("users_db_pool_size", "Configured size of the SQLAlchemy pool")
+DB_POOL_CHECKED_OUT = Gauge("users_db_pool_checked_out", "Connections currently in use")
+DB_POOL_OVERFLOW = Gauge("users_db_pool_overflow", "Connections opened above pool size")
+# Значения пула считываются в момент запроса /metrics
+DB_POOL_SIZE.set_function(lambda: engine.pool.size())
+DB_POOL_CHECKED_OUT.set_function(lambda: engine.pool.checkedout())
+DB_POOL_OVERFLOW.set_function(lambda: max(engine.pool.overflow(), 0))
+# Рост времени ожидания соединения - признак того, что пул мал для нагрузки
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "users_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+TimedQueuePool.on_checkout_wait = staticmethod(DB_POOL_CHECKOUT_WAIT.observe)
+
+# Результат поиска запроса в кэше скомпилированного SQL: cache_hit, cache_miss, ...
+DB_STATEMENT_CACHE = Counter(
+    "users_db_statement_cache_total", "SQLAlchemy compiled statement cache lookups", ["result"]
+)
+
+
+def count_statement_cache(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        DB_STATEMENT_CACHE.labels(context.cache_hit.name.lower()).inc()
+
+
+for db_engine in [engine, *read_engines]:
+    event.listen(db_engine.sync_engine, "before_cursor_execute", count_statement_cache)
+
+# Отставание реплик по последней проверке; -1 - реплика недоступна
+DB_REPLICA_LAG = Gauge("users_db_replica_lag_seconds", "Replication lag of read replicas", ["replica"])
+for i, read_engine in enumerate(read_engines):
+    DB_REPLICA_LAG.labels(read_engine.url.host).set_function(
+        lambda i=i: replica_lag[i] if replica_lag[i] is not None else -1
+    )
+
+router = APIRouter(tags=["metrics"])
+
+
+async def metrics_middleware(request: Request, call_next):
+    if request.url.path == "/metrics":
+        return await call_next(request)
+
+    REQUESTS_IN_FLIGHT.labels(request.method).inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.labels(request.method).dec()
+        # Шаблон пути (/users/get), а не URL с параметрами - чтобы не плодить метки
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        REQUEST_COUNT.labels(request.method, path, str(status_code)).inc()
+        REQUEST_LATENCY.labels(request.method, path).observe(time.perf_counter() - start)
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)